@@ -1,21 +1,36 @@
-import glob
 import os
+import asyncio
 import loguru
-import hashlib
 import smtplib
 import argparse
 import subprocess, shlex, pathlib
 import datetime
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numba
 import numpy as np
+import scipy.signal
 import librosa
+import soundfile as sf
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from blake3 import blake3
 from dotenv import dotenv_values
 
 logger = loguru.logger
 
 secrets = dotenv_values(".env")
 
+# stft parameters for the bark verification windows (the librosa defaults the
+# band indices below were tuned against) - the hann window is built once at
+# import instead of on every stft call
+N_FFT = 2048
+HOP_LENGTH = 512
+STFT_WINDOW = scipy.signal.get_window('hann', N_FFT).astype(np.float32)
+
 
 def get_sample_time(filename, sample_pos, sr=16000, type='dogmic') -> datetime.datetime:
     # start_time = os.path.basename(filename)
@@ -33,10 +48,50 @@ def get_sample_time(filename, sample_pos, sr=16000, type='dogmic') -> datetime.d
     return res
 
 
-def test_peaks(y, peak_pos, sr, window_duration=0.25,num_show=0):
+@numba.njit(parallel=True, cache=True)
+def _gather_windows(y, peak_pos, win_half, win_samples, scale):
+    '''Copy the (zero-padded) window around each peak into one float32 matrix.
+
+    scale converts int16 pcm to [-1, 1] here, so only the sparse stft
+    windows pay the int->float conversion rather than the whole signal.
+    '''
+    windows = np.zeros((len(peak_pos), win_samples), dtype=np.float32)
+    for i in numba.prange(len(peak_pos)):
+        cpeak = peak_pos[i]
+        start_sample = max(0, cpeak - win_half)
+        end_sample = min(len(y), cpeak + win_half)
+        for j in range(end_sample - start_sample):
+            windows[i, j] = y[start_sample + j] * scale
+    return windows
+
+
+@numba.njit(parallel=True, cache=True)
+def _classify_windows(S, ratio_threshold):
+    '''Compute the bark band-energy ratio per window from the complex stft.
+
+    Fuses the power spectrum, frame mean and band sums in one pass with no
+    temporaries, parallel over windows.
+    '''
+    n_windows, n_freqs, n_frames = S.shape
+    is_bark = np.empty(n_windows, dtype=np.bool_)
+    for i in numba.prange(n_windows):
+        total = 0.0
+        int_freq = 0.0
+        for k in range(n_freqs):
+            power = 0.0
+            for t in range(n_frames):
+                power += S[i, k, t].real ** 2 + S[i, k, t].imag ** 2
+            total += power
+            if (20 <= k < 80) or (95 <= k < 125):
+                int_freq += power
+        is_bark[i] = int_freq / (total - int_freq) > ratio_threshold
+    return is_bark
+
+
+def test_peaks(y, peak_pos, sr, window_duration=0.25,num_show=0, rms_min=0.01, zcr_range=(0.02, 0.5)):
     '''Validate the detected amplitude peaks to see they are dog barks
     we look at the main frequencies in the stft amplitude spectrum
-    
+
     For our dog, the peaks are:
 
     Parameters:
@@ -51,6 +106,11 @@ def test_peaks(y, peak_pos, sr, window_duration=0.25,num_show=0):
         The duration of the window to analyze around each peak in seconds.
     num_show: int
         The number of peaks to show in the plot for debugging.
+    rms_min: float
+        Minimum window RMS - quieter windows are rejected without an stft.
+    zcr_range: tuple of (float, float)
+        The zero-crossing rate band of a dog bark - windows outside it are
+        rejected without an stft.
 
     Returns:
     --------
@@ -63,33 +123,36 @@ def test_peaks(y, peak_pos, sr, window_duration=0.25,num_show=0):
     verified_peaks = []
     not_barks = []
     logger.debug(f'validating {len(peak_pos)} peaks')
-    last_peak = 0
-    num_tested = 0
-    for cpeak in peak_pos:
-        if cpeak < last_peak + sr * window_duration:
-            continue
-        last_peak = cpeak
-        num_tested += 1
-        start_sample = np.max([0,int(cpeak-sr*window_duration)])
-        end_sample = np.min([len(y),int(cpeak+sr*window_duration)])
-        y_cut = y[start_sample:end_sample]
-        res = librosa.stft(y_cut)
-        res = np.abs(res)
-        # res = librosa.amplitude_to_db(np.abs(res))
-        res_mean = res.mean(axis=1)
-        # normalize the mean to sum area=1
-        res_mean /= np.sum(res_mean)
-        # compare the to the expected bark frequencies
-        # dist = np.sum(np.abs(res_mean-bark_profile))
-        # print(f'peak {cpeak} has distance {dist}')
-        int_freq = np.sum(res_mean[20:80])+np.sum(res_mean[95:125])
-        bark_amp =  int_freq / (np.sum(res_mean) - int_freq)
-        # plt.title(f'Peak at {cpeak}, distance {dist}')
-        # if num_tested < num_show:
-        #     plt.figure()
-        #     plt.imshow(res, aspect='auto', origin='lower')
-        #     plt.title(f'Peak at {cpeak}, bark_amp {bark_amp}')
-        if bark_amp > 0.5:
+    # enforce minimum spacing between peaks in one vectorized pass instead of
+    # filtering millions of above-threshold samples one by one in python
+    if len(peak_pos) > 0:
+        peak_pos = peak_pos[np.concatenate(([True], np.diff(peak_pos) >= sr * window_duration))]
+    if len(peak_pos) == 0:
+        return verified_peak_pos, verified_peaks, not_barks
+    # stack all the peak windows into one matrix and run a single batched
+    # stft instead of paying the per-call setup overhead for every peak
+    # (windows at the signal edges are zero-padded to the common length)
+    win_half = int(sr * window_duration)
+    scale = np.float32(1.0 / 32768.0) if y.dtype == np.int16 else np.float32(1.0)
+    windows = _gather_windows(y, peak_pos, win_half, 2 * win_half, scale)
+    cuts = [y[max(0, int(cpeak - win_half)):min(len(y), int(cpeak + win_half))] for cpeak in peak_pos]
+    # cheap early-out before the ffts: silence (low rms) and steady noise /
+    # music (zero-crossing rate outside the bark band) don't need an stft
+    rms = np.sqrt(np.mean(windows * windows, axis=1))
+    zcr = np.mean(np.abs(np.diff(np.signbit(windows), axis=1)), axis=1)
+    candidates = (rms >= rms_min) & (zcr >= zcr_range[0]) & (zcr <= zcr_range[1])
+    logger.debug(f'{candidates.sum()} of {len(peak_pos)} windows passed the rms/zcr prefilter')
+    is_bark = np.zeros(len(peak_pos), dtype=bool)
+    if candidates.any():
+        # frame + windowed rfft directly with the precomputed hann window -
+        # same spectra librosa.stft would give, without its per-call setup
+        frames = librosa.util.frame(windows[candidates], frame_length=N_FFT, hop_length=HOP_LENGTH)
+        S = np.fft.rfft(frames * STFT_WINDOW[:, None], axis=1)
+        # the power spectrum + band-energy ratio test is a jitted kernel,
+        # parallel over windows (the bark bands are 20:80 and 95:125)
+        is_bark[candidates] = _classify_windows(S, 0.5)
+    for cpeak, y_cut, ok in zip(peak_pos, cuts, is_bark):
+        if ok:
             verified_peaks.append(y_cut)
             verified_peak_pos.append(cpeak)
         else:
@@ -98,68 +161,184 @@ def test_peaks(y, peak_pos, sr, window_duration=0.25,num_show=0):
     return verified_peak_pos, verified_peaks, not_barks
 
 
-def calculate_barks(filename: str, bark_threshold: float = 0.3, bark_max_interval: float = 10, type='camera'):
+def calculate_barks(filename: str, y=None, sr=None, bark_threshold: float = 0.3, bark_max_interval: float = 10, type='camera'):
     # get all the files in the base_dir that match the date
-    barks = pd.DataFrame(columns=['start_samples', 'end_samples', 'start_time', 'end_time', 'duration', 'num_barks', 'date', 'duration_sec', 'file_time'])
+    # accumulate events in a plain list and build the dataframe once at the
+    # end - pd.concat per row copies the whole accumulated frame (O(N^2))
+    rows = []
 
     for file in [filename]:
         logger.info('processing file %s' % file)
-        y, sr = librosa.load(file)
+        if y is None:
+            # read at the native sample rate - librosa.load resamples to
+            # 22050 Hz with an expensive FIR and the detection doesn't need it
+            # (int16 to match the pipe path - half the bandwidth of float32)
+            y, sr = sf.read(file, dtype='int16', always_2d=False)
+            if y.ndim > 1:
+                y = y.mean(axis=1).astype(np.int16)
         start_time = get_sample_time(file, 0, sr=sr, type=type)
         logger.info('start time: %s' % start_time)
-        # identify bark events
-        peak_pos = np.where(y > bark_threshold)[0]
+        # identify bark events - compare int16 samples against a fixed-point
+        # threshold so the O(N) scan stays at half the float32 bandwidth
+        if y.dtype == np.int16:
+            thr = np.int16(bark_threshold * 32767)
+        else:
+            thr = bark_threshold
+        peak_pos = np.flatnonzero(y > thr)
         # peak_pos = validate_peaks(y, peak_pos, sr)
         peak_pos, ok_barks, not_barks = test_peaks(y, peak_pos, sr)
         if len(peak_pos) == 0:
             logger.info("No barks detected.")
             continue
-        peak_index = 0
-        done = False
-        while not done:
-            # logger.info('current peak: %d (position %f)'% ( peak_index, peak_pos[peak_index]))
-            next_peak_index = peak_index + 1
-            while next_peak_index < len(peak_pos) and peak_pos[next_peak_index] - peak_pos[peak_index] < bark_max_interval * sr:
-                next_peak_index += 1
-            # logger.info(f'next peak index: {next_peak_index} (position {peak_pos[next_peak_index-1]})')
-            # we have a bark event from peak_index to next_peak_index
-            start_sample = peak_pos[peak_index]
-            end_sample = peak_pos[next_peak_index - 1] + bark_max_interval * sr
-            # start_time_event = datetime.timedelta(seconds=start_sample / sr) + start_time
-            # end_time_event = datetime.timedelta(seconds=end_sample / sr) + start_time
-            start_time_event = get_sample_time(file, sample_pos=start_sample, sr=sr, type=type)
-            end_time_event = get_sample_time(file, sample_pos=end_sample, sr=sr, type=type)
+        # cluster peaks into bark events in one vectorized pass: a new event
+        # starts wherever the gap to the previous peak is >= bark_max_interval
+        peak_pos = np.asarray(peak_pos)
+        gap = np.diff(peak_pos) >= bark_max_interval * sr
+        event_starts = np.concatenate(([0], np.flatnonzero(gap) + 1))
+        event_ends = np.concatenate((np.flatnonzero(gap) + 1, [len(peak_pos)]))
+        start_samples = peak_pos[event_starts]
+        end_samples = peak_pos[event_ends - 1] + bark_max_interval * sr
+        event_num_barks = event_ends - event_starts
+        for start_sample, end_sample, num_barks in zip(start_samples, end_samples, event_num_barks):
+            # the filename was already strptime-parsed into start_time above,
+            # so per event we only add the sample offset
+            start_time_event = start_time + datetime.timedelta(seconds=int(start_sample / sr))
+            end_time_event = start_time + datetime.timedelta(seconds=int(end_sample / sr))
             duration = (end_time_event - start_time_event)
-            num_barks = next_peak_index - peak_index
-            
-            # Create a new row as a DataFrame and concatenate it
-            new_row = pd.DataFrame({
-                'file_time': [start_time.strftime("%H:%M")],
-                'start_samples': [start_sample],
-                'end_samples': [end_sample],
-                'start_time': [start_time_event],
-                'end_time': [end_time_event],
-                'duration': [duration],
-                'num_barks': [num_barks],
-                'date': [start_time_event.date()],
-                'duration_sec': [duration.total_seconds()]
+            rows.append({
+                'file_time': start_time.strftime("%H:%M"),
+                'start_samples': start_sample,
+                'end_samples': end_sample,
+                'start_time': start_time_event,
+                'end_time': end_time_event,
+                'duration': duration,
+                'num_barks': num_barks,
+                'date': start_time_event.date(),
+                'duration_sec': duration.total_seconds()
             })
-            barks = pd.concat([barks, new_row], ignore_index=True)
-            
-            peak_index = next_peak_index
-            if peak_index >= len(peak_pos):
-                done = True
+    barks = pd.DataFrame(rows, columns=['start_samples', 'end_samples', 'start_time', 'end_time', 'duration', 'num_barks', 'date', 'duration_sec', 'file_time'])
     return barks
 
 
-def mkv_to_mp3(mkv_path, stream_index=0, out_path=None, vbr_quality=2):
-    logger.info(f"Extracting audio from {mkv_path}")
+def _extract_audio_cmd(mkv_path, stream_index=0, out_path=None, sr=16000, threads=1):
+    '''Build the ffmpeg command (and output path) for the wav extraction.'''
     mkv_path = pathlib.Path(mkv_path)
     if out_path is None:
-        out_path = mkv_path.with_suffix(".mp3")
-    cmd = f'ffmpeg -hide_banner -y -i "{mkv_path}" -vn -map 0:a:{stream_index} -c:a libmp3lame -q:a {vbr_quality} "{out_path}"'
-    subprocess.run(shlex.split(cmd), check=True)
-    return str(out_path)
+        out_path = mkv_path.with_suffix(".wav")
+    cmd = f'ffmpeg -hide_banner -loglevel error -threads {threads} -y -i "{mkv_path}" -vn -map 0:a:{stream_index} -c:a pcm_s16le -ar {sr} -ac 1 -threads {threads} "{out_path}"'
+    return shlex.split(cmd), str(out_path)
+
+
+def extract_audio(mkv_path, stream_index=0, out_path=None, sr=16000, threads=1):
+    '''Extract the audio track to a mono 16-bit WAV next to the video file.
+
+    Raw PCM skips the CPU-heavy perceptual mp3 encode, and downstream
+    readers decode WAV essentially for free.
+    '''
+    logger.info(f"Extracting audio from {mkv_path}")
+    cmd, out_path = _extract_audio_cmd(mkv_path, stream_index=stream_index, out_path=out_path, sr=sr, threads=threads)
+    subprocess.run(cmd, check=True)
+    return out_path
+
+
+async def _extract_audio_async(files, workers=1, threads=1):
+    '''Extract the wavs for all files as concurrent ffmpeg processes.
+
+    ffmpeg does all the work in its own process, so a semaphore-bounded
+    asyncio orchestrator gets the same overlap as a process pool with no
+    pickling or worker overhead.
+    '''
+    sem = asyncio.Semaphore(workers)
+
+    async def one(f):
+        cmd, out_path = _extract_audio_cmd(f, threads=threads)
+        async with sem:
+            logger.info(f"Extracting audio from {f}")
+            proc = await asyncio.create_subprocess_exec(*cmd)
+            if await proc.wait() != 0:
+                logger.warning(f"Failed to extract audio from {f}")
+            else:
+                logger.info(f"Extracted audio to {out_path}")
+
+    await asyncio.gather(*(one(f) for f in files))
+
+
+def checksum_and_decode(mkv_path, stream_index=0, sr=16000, threads=1):
+    '''Decode audio to a numpy array and calculate the blake3 checksum in a single read pass
+
+    The pipeline is disk-bandwidth bound, so instead of reading the MKV once
+    for the checksum and again for ffmpeg, the file is read once and each
+    chunk is teed to both the hasher and ffmpeg's stdin. ffmpeg decodes the
+    audio straight to raw mono PCM on stdout, so there is no mp3
+    encode/decode round trip and no temporary file on disk.
+
+    Parameters
+    ----------
+    mkv_path : str
+        The path to the video file to process.
+    stream_index : int
+        The audio stream index to extract.
+    sr : int
+        The sample rate to resample the audio to.
+    threads : int
+        Number of threads ffmpeg may use (bounded so parallel workers
+        don't oversubscribe the machine).
+
+    Returns
+    -------
+    tuple of (str, np.ndarray, int)
+        The blake3 checksum, the audio signal (int16 pcm - half the memory
+        traffic of float32; converted to float lazily where needed) and the
+        sample rate.
+    '''
+    logger.info(f"Decoding audio and hashing {mkv_path}")
+    cmd = f'ffmpeg -hide_banner -loglevel error -threads {threads} -i pipe:0 -vn -map 0:a:{stream_index} -ac 1 -ar {sr} -f s16le -threads {threads} -'
+    proc = subprocess.Popen(shlex.split(cmd), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    file_hash = blake3()
+
+    # feed + hash on a thread so reading stdout can't deadlock on full pipes
+    feed_error = []
+
+    def feed():
+        # unbuffered reads into one reused 1 MiB buffer (no per-chunk
+        # allocation), with a sequential-access hint so the kernel
+        # prefetches aggressively (posix_fadvise is not available on macos)
+        try:
+            buf = bytearray(1024 * 1024)
+            mv = memoryview(buf)
+            with open(mkv_path, 'rb', buffering=0) as f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                while n := f.readinto(buf):
+                    file_hash.update(mv[:n])
+                    proc.stdin.write(mv[:n])
+        except BrokenPipeError:
+            # ffmpeg exited early - the non-zero proc.wait() below reports it
+            pass
+        except Exception as err:
+            # surface e.g. FileNotFoundError in the main thread instead of
+            # dumping a traceback here
+            feed_error.append(err)
+        finally:
+            # always close stdin so ffmpeg (and the stdout read) can't hang
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    raw = proc.stdout.read()
+    feeder.join()
+    returncode = proc.wait()
+    if feed_error:
+        raise feed_error[0]
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    y = np.frombuffer(raw, np.int16)
+    hash = file_hash.hexdigest()
+    logger.info(f"blake3 for {mkv_path} is {hash}")
+    return hash, y, sr
 
 
 def send_email(recipient, subject, body, user='irrigation.computer.amnon@gmail.com', pwd=None, smtp_server='smtp-relay.sendinblue.com', smtp_port=587, smtp_user='sugaroops@yahoo.com'):
@@ -204,48 +383,60 @@ def send_email(recipient, subject, body, user='irrigation.computer.amnon@gmail.c
         return False
 
 
-def calculate_md5(file):
-    '''calculate the md5 checksum for a given file
+def calculate_checksum(file):
+    '''calculate the blake3 checksum for a given file
+
+    blake3 uses the SIMD (AVX2/NEON) backend and hashes the mmapped file
+    with all cores, so hashing multi-GB files is disk-bound rather than
+    CPU-bound (much faster than the old md5).
 
     Parameters
     ----------
     file : str
-        The path to the file for which to calculate the md5 checksum.
+        The path to the file for which to calculate the checksum.
 
     Returns
     -------
     str
-        The md5 checksum of the file.
+        The blake3 checksum of the file.
     '''
-    with open(file, "rb") as f:
-        file_hash = hashlib.md5()
-        while chunk := f.read(8192):
-            file_hash.update(chunk)
+    file_hash = blake3(max_threads=blake3.AUTO)
+    file_hash.update_mmap(file)
     hash = file_hash.hexdigest()
-    logger.info(f"MD5 for {file} is {hash}")
+    logger.info(f"blake3 for {file} is {hash}")
     return hash
 
 
 def find_new_files(dir='/Users/amnon/Downloads/', type='mkv'):
-    '''Get list of new video file that still don't have .md5 file (and are not empty)
-    
+    '''Get list of new video file that still don't have a checksum file (and are not empty)
+
+    Files with a legacy .md5 sidecar are also considered already processed.
+
     Parameters
     ----------
     dir : str
         The directory to search for new video files.
     type : str
         The file extension of the video files to search for.
-    
+
     Returns
     -------
     list
         A list of new video files that need to be processed.
     '''
+    # a single scandir enumerates the directory once - the DirEntry carries
+    # the size and the sidecar check is a set lookup, instead of the three
+    # stat calls per file that glob + exists + getsize cost
     new_files = []
-    files = glob.glob(os.path.join(dir, f'*.{type}'))
-    for f in files:
-        if not os.path.exists(f + '.md5') and os.path.getsize(f) > 0:
-            new_files.append(f)
+    with os.scandir(dir) as it:
+        entries = {e.name: e for e in it}
+    for name, entry in entries.items():
+        if not name.endswith(f'.{type}'):
+            continue
+        if name + '.b3sum' in entries or name + '.md5' in entries:
+            continue
+        if entry.stat().st_size > 0:
+            new_files.append(entry.path)
     if new_files:
         logger.info(f"Found {len(new_files)} files")
     else:
@@ -253,60 +444,191 @@ def find_new_files(dir='/Users/amnon/Downloads/', type='mkv'):
     return new_files
 
 
-def pipeline(dir='/Users/amnon/Downloads/'):
+def process_one(f, threads=1, decoded=None):
+    '''Process a single video file (checksum -> decode -> barks)
+
+    Runs in a worker process - each file is fully independent, so the only
+    shared state (mail lines and the barks log) is handled by the caller.
+
+    Parameters
+    ----------
+    f : str
+        The path to the video file to process.
+    threads : int
+        Number of threads each ffmpeg invocation may use.
+    decoded : tuple or None
+        Pre-decoded (checksum, y, sr) when the caller already ran
+        checksum_and_decode (the serial decode-ahead path).
+
+    Returns
+    -------
+    tuple of (str or None, pd.DataFrame or None)
+        The mail line for the checksum (or None if hashing failed),
+        and the barks dataframe (or None if audio extraction failed).
+    '''
+    logger.info(f"Processing file: {f}")
+    # calculate checksum and decode the audio in a single read pass
+    mail_line = None
+    if decoded is None:
+        try:
+            decoded = checksum_and_decode(f, threads=threads)
+        except subprocess.CalledProcessError:
+            # no decodable audio - hash the file on its own so it still gets
+            # its .b3sum sidecar and isn't rescanned forever
+            logger.warning(f"Failed to extract audio from {f}")
+            decoded = (calculate_checksum(f), None, None)
+    checksum, y, sr = decoded
+    if checksum:
+        with open(f + '.b3sum', 'w') as checksum_file:
+            checksum_file.write(checksum)
+        mail_line = f"Checksum for {f}: {checksum}"
+    else:
+        logger.warning(f"Failed to calculate checksum for {f}")
+    if y is None:
+        return mail_line, None
+    # identify barks
+    barks = calculate_barks(f, y=y, sr=sr, bark_threshold=0.3, bark_max_interval=10, type='camera')
+    logger.info(f"Identified {len(barks)} bark events in {f}, total barks duration {barks['duration'].sum()}")
+    return mail_line, barks
+
+
+def _process_serial(new_files, threads=1):
+    '''Process files one by one, decoding the next file while detecting barks on the current.
+
+    ffmpeg decode (I/O + decoder threads) and bark detection (FFT on the
+    main thread) use disjoint resources, so a decode-ahead thread feeding a
+    1-slot queue overlaps the two stages instead of running them serially.
+
+    Yields (mail_line, barks) per file, like process_one.
+    '''
+    decoded_queue = queue.Queue(maxsize=1)
+
+    def decode_ahead():
+        try:
+            for f in new_files:
+                try:
+                    decoded_queue.put((f, checksum_and_decode(f, threads=threads)))
+                except subprocess.CalledProcessError:
+                    logger.warning(f"Failed to extract audio from {f}")
+                    decoded_queue.put((f, None))
+                except Exception as err:
+                    # anything else (ffmpeg missing, file moved away) goes to
+                    # the consumer to re-raise - dying here without the
+                    # sentinel would leave the main thread blocked in get()
+                    decoded_queue.put((f, err))
+                    return
+        finally:
+            decoded_queue.put(None)
+
+    # daemon so that if the consumer raises and abandons the generator while
+    # the decoder is blocked in put(), the thread can't keep the process
+    # alive forever (the crash propagates like in the sequential code)
+    decoder = threading.Thread(target=decode_ahead, daemon=True)
+    decoder.start()
+    while (item := decoded_queue.get()) is not None:
+        f, decoded = item
+        if isinstance(decoded, Exception):
+            # producer failure - crash cleanly like the sequential code
+            raise decoded
+        if decoded is None:
+            # decode failed - hash alone so the file still gets its sidecar
+            decoded = (calculate_checksum(f), None, None)
+        yield process_one(f, threads=threads, decoded=decoded)
+    decoder.join()
+
+
+def pipeline(dir='/Users/amnon/Downloads/', workers=None, keep_audio=False, threads_per_worker=None, legacy_tsv=False):
     '''Perform the main pipeline processing:
-    1. identify new video files (without .md5)
-    2. calculate md5 checksums
-    3. save checksums to .md5 files
-    4. send md5 as email
+    1. identify new video files (without .b3sum)
+    2. calculate blake3 checksums
+    3. save checksums to .b3sum files
+    4. send checksums as email
     5. extract audio
     6. identify barks
     7. save bark to log file
+
+    Files are independent, so they are processed in parallel in a process
+    pool. workers is bounded so the ffmpeg subprocesses don't stampede the
+    machine (default is half the cores).
     '''
+    if workers is None:
+        workers = max(1, os.cpu_count() // 2)
+    if threads_per_worker is None:
+        # split the cores between the parallel ffmpeg instances so N workers
+        # don't each spawn cpu_count() ffmpeg threads
+        threads_per_worker = max(1, os.cpu_count() // workers)
     new_files = find_new_files(dir)
     mail_lines = []
     if len(new_files) == 0:
         return
 
-    create_barks_header = True
-    for f in new_files:
-        logger.info(f"Processing file: {f}")
-        # calculate md5 and save to X.md5
-        md5_hash = calculate_md5(f)
-        if md5_hash:
-            with open(f + '.md5', 'w') as md5_file:
-                md5_file.write(md5_hash)
-            mail_lines.append(f"MD5 for {f}: {md5_hash}")
-        else:
-            logger.warning(f"Failed to calculate MD5 for {f}")
-        mp3_file = mkv_to_mp3(f)
-        if mp3_file:
-            logger.info(f"Extracted audio to {mp3_file}")
-        else:
-            logger.warning(f"Failed to extract audio from {f}")
-            continue
-        # identify barks
-        barks = calculate_barks(mp3_file, bark_threshold=0.3, bark_max_interval=10, type='camera')
-        logger.info(f"Identified {len(barks)} bark events in {mp3_file}, total barks duration {barks['duration'].sum()}")
-        with open('barks_log.tsv', 'a') as bark_log:
+    if keep_audio:
+        # the wav extractions are pure ffmpeg work, so run them all up front
+        # as concurrent subprocesses instead of tying up pool workers
+        asyncio.run(_extract_audio_async(new_files, workers=workers, threads=threads_per_worker))
+
+    all_barks = []
+    if workers == 1 or len(new_files) == 1:
+        # no process pool - overlap the next decode with bark detection instead
+        results = _process_serial(new_files, threads=threads_per_worker)
+        for mail_line, barks in results:
+            if mail_line:
+                mail_lines.append(mail_line)
             if barks is not None and len(barks) > 0:
+                all_barks.append(barks)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(new_files))) as ex:
+            futures = [ex.submit(process_one, f, threads=threads_per_worker) for f in new_files]
+            for future in as_completed(futures):
+                mail_line, barks = future.result()
+                if mail_line:
+                    mail_lines.append(mail_line)
+                if barks is not None and len(barks) > 0:
+                    all_barks.append(barks)
+
+    # single writer for the barks log so rows from parallel files don't interleave
+    if legacy_tsv:
+        create_barks_header = True
+        with open('barks_log.tsv', 'a') as bark_log:
+            for barks in all_barks:
                 bark_log.write(barks.to_csv(sep='\t', index=False, header=create_barks_header))
                 create_barks_header = False
-        # delete the mp3 file
-        os.remove(mp3_file)
+    elif all_barks:
+        # parquet is much smaller than tsv and columnar for downstream
+        # analysis; there is no parquet append, so the previous log is
+        # re-written as the first row group of the new file
+        old_table = None
+        if os.path.exists('barks_log.parquet'):
+            old_table = pq.read_table('barks_log.parquet')
+        schema = old_table.schema if old_table is not None else pa.Schema.from_pandas(all_barks[0], preserve_index=False)
+        # write to a temp file and replace the log only once it is complete,
+        # so a crash mid-write can't destroy the existing bark history
+        writer = pq.ParquetWriter('barks_log.parquet.tmp', schema, compression='zstd')
+        try:
+            if old_table is not None:
+                writer.write_table(old_table)
+            for barks in all_barks:
+                writer.write_table(pa.Table.from_pandas(barks, preserve_index=False).cast(schema))
+        finally:
+            writer.close()
+        os.replace('barks_log.parquet.tmp', 'barks_log.parquet')
 
     if mail_lines:
-        send_email(secrets.get('TARGET_EMAIL'), "MD5 Checksums", "\n".join(mail_lines))
+        send_email(secrets.get('TARGET_EMAIL'), "Checksums", "\n".join(mail_lines))
 
     # Done processing all files
     logger.info("Pipeline processing complete.")
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Process video files for calculating md5 hash, extracting audio and identifying barks")
+    parser = argparse.ArgumentParser(description="Process video files for calculating checksum, extracting audio and identifying barks")
     parser.add_argument("--dir", type=str, default="/Users/amnon/Downloads/", help="Directory to scan for video files")
+    parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() // 2), help="Number of files to process in parallel")
+    parser.add_argument("--keep-audio", action='store_true', help="Also write a wav of the audio next to each video file")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="Threads per ffmpeg instance (default: cores divided by workers)")
+    parser.add_argument("--legacy-tsv", action='store_true', help="Append barks to barks_log.tsv instead of barks_log.parquet")
     args = parser.parse_args()
-    pipeline(dir=args.dir)
+    pipeline(dir=args.dir, workers=args.workers, keep_audio=args.keep_audio, threads_per_worker=args.threads_per_worker, legacy_tsv=args.legacy_tsv)
 
 
 if __name__ == "__main__":